@@ -7,10 +7,41 @@ import subprocess
 import sys
 import time
 import argparse
+import http.client
+import json
 import signal
 import os
+import stat
+import tempfile
 import requests
 from pathlib import Path
+from urllib.parse import urlparse
+
+
+def default_uds_path():
+    """Per-user UNIX socket path that other local users cannot pre-create.
+
+    Uses $XDG_RUNTIME_DIR, else a private directory under the system temp
+    dir. Returns "" (TCP only) if no such directory is available.
+    """
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    if not runtime_dir:
+        if not hasattr(os, "getuid"):
+            return ""
+        runtime_dir = os.path.join(tempfile.gettempdir(), f"img_editor-{os.getuid()}")
+        try:
+            os.makedirs(runtime_dir, mode=0o700, exist_ok=True)
+            info = os.lstat(runtime_dir)
+        except OSError:
+            return ""
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+            return ""
+    return os.path.join(runtime_dir, "img_editor.sock")
+
+
+# UNIX socket the server also listens on, used by the co-located WebUI
+SERVER_UDS = os.environ["SERVER_UDS"] if "SERVER_UDS" in os.environ else default_uds_path()
+SERVICE_ENV = {**os.environ, "SERVER_UDS": SERVER_UDS}
 
 
 def check_dependencies():
@@ -53,18 +84,37 @@ def check_server_health(server_url="http://localhost:8888"):
         return False
 
 
-def wait_for_server(server_url="http://localhost:8888", timeout=30000):
-    """Wait for server to be ready."""
+def probe_health(connection):
+    """Check readiness over a reused connection; it reconnects after errors."""
+    try:
+        connection.request("GET", "/health")
+        response = connection.getresponse()
+        body = response.read()
+        return response.status == 200 and json.loads(body).get("ready", False)
+    except (OSError, http.client.HTTPException, ValueError):
+        connection.close()
+        return False
+
+
+def wait_for_server(server_url="http://localhost:8888", timeout=600):
+    """Wait for server to be ready, backing off exponentially between polls."""
     print("⏳ Waiting for server to load model...")
     start_time = time.time()
+    url = urlparse(server_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=3)
+    attempt = 0
     
-    while time.time() - start_time < timeout:
-        if check_server_health(server_url):
-            print("✅ Server is ready!")
-            return True
-        
-        print(".", end="", flush=True)
-        time.sleep(2)
+    try:
+        while time.time() - start_time < timeout:
+            if probe_health(connection):
+                print("✅ Server is ready!")
+                return True
+            
+            print(".", end="", flush=True)
+            time.sleep(min(8.0, 0.2 * 1.5 ** attempt))
+            attempt += 1
+    finally:
+        connection.close()
     
     print(f"\n❌ Server not ready after {timeout} seconds")
     return False
@@ -74,7 +124,7 @@ def start_server():
     """Start the persistent server."""
     print("🚀 Starting persistent server...")
     try:
-        subprocess.run([sys.executable, "server.py"])
+        subprocess.run([sys.executable, "server.py"], env=SERVICE_ENV)
     except KeyboardInterrupt:
         print("\n🛑 Server stopped")
 
@@ -93,7 +143,7 @@ def start_webui():
             sys.executable, "-m", "streamlit", "run", "webui.py",
             "--server.address", "0.0.0.0",
             "--server.port", "30700"
-        ])
+        ], env=SERVICE_ENV)
     except KeyboardInterrupt:
         print("\n🛑 Web UI stopped")
 
@@ -123,9 +173,7 @@ def start_both():
         print("\n🚀 Step 1: Starting persistent server...")
         server_process = subprocess.Popen(
             [sys.executable, "server.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True
+            env=SERVICE_ENV
         )
         
         # Wait for server to be ready
@@ -139,7 +187,7 @@ def start_both():
             sys.executable, "-m", "streamlit", "run", "webui.py",
             "--server.address", "0.0.0.0",
             "--server.port", "30700"
-        ])
+        ], env=SERVICE_ENV)
         
         print(f"✅ WebUI started at: http://localhost:30700")
         print("\n🎯 System ready!")
@@ -5,20 +5,39 @@ Uses HTTP/WebSocket to serve requests without restarting.
 """
 
 import asyncio
-import base64
+import contextlib
+import hashlib
 import io
 import json
 import logging
 import os
 import signal
+import stat
+import struct
 import sys
-from typing import Dict, Any
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
+import numpy as np
 import torch
 import uvicorn
+from torch.nn.attention import SDPBackend, sdpa_kernel
 from diffusers import FluxKontextPipeline
 from PIL import Image
-from fastapi import FastAPI, HTTPException
+from fastapi import (
+    FastAPI,
+    File,
+    Form,
+    Header,
+    HTTPException,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
@@ -26,9 +45,24 @@ from pydantic import BaseModel
 MODEL_PATH = os.getenv("MODEL_PATH", "./models/black-forest-labs/FLUX.1-Kontext-dev")
 DEVICE = os.getenv("DEVICE", None)  # Auto-detect if None
 TORCH_DTYPE = os.getenv("TORCH_DTYPE", "bfloat16")
+QUANT = os.getenv("QUANT", "bf16")  # nf4, int8, fp8, fp8_rowwise, mxfp8, nvfp4, cublas_hgemm or bf16
+OFFLOAD_TEXT_ENCODERS = os.getenv("OFFLOAD_TEXT_ENCODERS", "false").lower() in ("1", "true", "yes")
+TORCH_COMPILE = os.getenv("TORCH_COMPILE", "true").lower() in ("1", "true", "yes")
+CUDA_GRAPHS = os.getenv("CUDA_GRAPHS", "false").lower() in ("1", "true", "yes")  # needs TORCH_COMPILE
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "4"))
+BATCH_WAIT_MS = float(os.getenv("BATCH_WAIT_MS", "20"))
+BATCH_VRAM_PER_IMAGE_GB = float(os.getenv("BATCH_VRAM_PER_IMAGE_GB", "2.0"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "64"))  # 0 disables
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "64"))  # 0 disables
+DEFAULT_INFERENCE_STEPS = 28
+PREVIEW_INFERENCE_STEPS = 8
+PREVIEW_RESOLUTION = 768  # Preview output area is PREVIEW_RESOLUTION ** 2
+LATENT_RESUME_STEP = int(os.getenv("LATENT_RESUME_STEP", "0"))  # 0 disables
+LATENT_CACHE_SIZE = int(os.getenv("LATENT_CACHE_SIZE", "16"))
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
 SERVER_PORT = int(os.getenv("SERVER_PORT", "8888"))
+SERVER_UDS = os.getenv("SERVER_UDS", "")  # Also serve on this UNIX socket if set
 
 # Setup logging
 logging.basicConfig(
@@ -41,6 +75,49 @@ logger = logging.getLogger(__name__)
 pipe = None
 model_loaded = False
 
+class LRUCache:
+    """Thread-safe in-process least-recently-used cache."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+# Edited results keyed on (input image, prompt, guidance scale)
+result_cache = LRUCache(RESULT_CACHE_SIZE)
+
+# Text encoder outputs (prompt_embeds, pooled_prompt_embeds) keyed on prompt
+prompt_cache = LRUCache(PROMPT_CACHE_SIZE)
+
+# Latents after LATENT_RESUME_STEP steps keyed on (image sha256, settings)
+latent_cache = LRUCache(LATENT_CACHE_SIZE)
+
+# All pipeline calls run on this one thread, which serializes GPU work
+# while decoding/encoding runs in other threads. Captured CUDA graphs are
+# also thread-local, so warmup and requests must share it to replay them.
+gpu_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gpu")
+
+# Edit jobs waiting for the batch worker
+edit_queue = None
+batch_worker_task = None
+
 # FastAPI app
 app = FastAPI(title="AI Image Editor Server", version="1.0.0")
 
@@ -55,21 +132,12 @@ app.add_middleware(
 
 
 # Request/Response models
-class EditImageRequest(BaseModel):
-    image_base64: str
-    prompt: str
-    guidance_scale: float = 2.5
-
-
-class EditImageResponse(BaseModel):
-    result: str
-
-
 class ModelInfoResponse(BaseModel):
     model_name: str
     model_path: str
     device: str
     torch_dtype: str
+    quant: str
     loaded: bool
 
 
@@ -79,6 +147,289 @@ class HealthResponse(BaseModel):
     ready: bool
 
 
+@dataclass
+class EditJob:
+    """A queued edit request and the future its result is delivered to."""
+    image: Image.Image
+    prompt: str
+    guidance_scale: float
+    num_inference_steps: int
+    # Output (height, width), or None for the pipeline's default
+    output_size: Optional[Tuple[int, int]]
+    future: asyncio.Future
+    # Called from the pipeline thread with (step, total_steps)
+    progress: Optional[Callable[[int, int], None]] = None
+    # Where to stash this job's partially denoised latents, if enabled
+    latent_key: Optional[Tuple] = None
+    # Stashed latents to resume denoising from instead of pure noise
+    resume_latents: Optional[torch.Tensor] = None
+
+    @property
+    def batch_key(self):
+        # Kontext resizes a whole batch to the first image's resolution,
+        # so only same-sized inputs with the same settings share a call
+        return (
+            self.image.size,
+            self.guidance_scale,
+            self.num_inference_steps,
+            self.output_size,
+            self.resume_latents is not None,
+        )
+
+
+def load_nf4_transformer(torch_dtype: torch.dtype):
+    """Load the FLUX transformer with bitsandbytes NF4 weights."""
+    from diffusers import BitsAndBytesConfig, FluxTransformer2DModel
+
+    quantization_config = BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_quant_type="nf4",
+        bnb_4bit_compute_dtype=torch_dtype,
+    )
+    return FluxTransformer2DModel.from_pretrained(
+        MODEL_PATH,
+        subfolder="transformer",
+        quantization_config=quantization_config,
+        torch_dtype=torch_dtype,
+    )
+
+
+# Minimum CUDA compute capability for the FP8/FP4 modes
+LOW_PRECISION_MIN_CAPABILITY = {
+    "fp8": (8, 9),
+    "fp8_rowwise": (9, 0),
+    "mxfp8": (10, 0),
+    "nvfp4": (10, 0),
+}
+
+# Modes quantizing activations as well as weights, applied on the GPU
+LOW_PRECISION_MODES = ("fp8_rowwise", "mxfp8", "nvfp4")
+
+
+def require_compute_capability(quant: str, device: str):
+    """Raise if the GPU is too old for the given FP8/FP4 mode."""
+    if not device.startswith("cuda") or not torch.cuda.is_available():
+        raise RuntimeError(f"QUANT={quant} requires a CUDA GPU")
+
+    capability = torch.cuda.get_device_capability(torch.device(device))
+    required = LOW_PRECISION_MIN_CAPABILITY[quant]
+    if capability < required:
+        raise RuntimeError(
+            f"QUANT={quant} requires compute capability sm_{required[0]}{required[1]}+, "
+            f"found sm_{capability[0]}{capability[1]}"
+        )
+
+
+def quantize_pipeline(pipe, quant: str, device: str):
+    """Apply torchao weight-only quantization to the transformer and VAE."""
+    from torchao.quantization import (
+        Float8WeightOnlyConfig,
+        Int8WeightOnlyConfig,
+        quantize_,
+    )
+
+    if quant in LOW_PRECISION_MIN_CAPABILITY:
+        require_compute_capability(quant, device)
+
+    config_map = {
+        "int8": Int8WeightOnlyConfig,
+        "fp8": Float8WeightOnlyConfig,
+    }
+    quantize_(pipe.transformer, config_map[quant]())
+    quantize_(pipe.vae, config_map[quant]())
+
+
+# Transformer layers kept in high precision (embedders and final projection)
+LOW_PRECISION_SKIP_LAYERS = (
+    "x_embedder",
+    "context_embedder",
+    "time_text_embed",
+    "norm_out",
+    "proj_out",
+)
+
+
+def quantize_transformer_low_precision(pipe, quant: str, device: str):
+    """Quantize transformer activations and weights to FP8/FP4 with torchao."""
+    from torchao.quantization import (
+        Float8DynamicActivationFloat8WeightConfig,
+        PerRow,
+        quantize_,
+    )
+
+    require_compute_capability(quant, device)
+
+    if quant == "fp8_rowwise":
+        config = Float8DynamicActivationFloat8WeightConfig(granularity=PerRow())
+    elif quant == "mxfp8":
+        from torchao.prototype.mx_formats import MXFPInferenceConfig
+
+        config = MXFPInferenceConfig(
+            activation_dtype=torch.float8_e4m3fn,
+            weight_dtype=torch.float8_e4m3fn,
+        )
+    else:
+        from torchao.prototype.mx_formats import NVFP4InferenceConfig
+
+        config = NVFP4InferenceConfig()
+
+    def filter_fn(module: torch.nn.Module, fqn: str) -> bool:
+        return isinstance(module, torch.nn.Linear) and not fqn.startswith(
+            LOW_PRECISION_SKIP_LAYERS
+        )
+
+    quantize_(pipe.transformer, config, filter_fn=filter_fn)
+
+
+def replace_with_cublas_linear(pipe):
+    """Run the transformer blocks' matmuls in fp16 with fp16 accumulation.
+
+    Expects the whole pipeline to be loaded in fp16. The embedders and norms
+    stay as they are; they are a small share of the weights but sensitive to
+    precision. diffusers' FLUX blocks already clip fp16 activations at the
+    known overflow points.
+    """
+    from cublas_ops import CublasLinear
+
+    for blocks in (pipe.transformer.transformer_blocks, pipe.transformer.single_transformer_blocks):
+        for name, module in list(blocks.named_modules()):
+            if type(module) is not torch.nn.Linear:
+                continue
+            replacement = CublasLinear(
+                module.in_features,
+                module.out_features,
+                bias=module.bias is not None,
+                device=module.weight.device,
+                dtype=torch.float16,
+            )
+            replacement.load_state_dict(module.state_dict())
+            parent_name, _, child_name = name.rpartition(".")
+            parent = blocks.get_submodule(parent_name) if parent_name else blocks
+            setattr(parent, child_name, replacement)
+
+
+def offload_text_encoders(pipe, device: str):
+    """Keep the CLIP and T5 encoders on CPU, moving them to the GPU to encode.
+
+    The hooks are chained CLIP -> T5 -> VAE: each module evicts the previous
+    one when it runs, so T5 leaves the GPU as soon as the input image is
+    encoded and only the transformer and VAE stay resident while denoising.
+    The hooked modules start on CPU; only the transformer is moved up front.
+    """
+    from accelerate import cpu_offload_with_hook
+
+    hook = None
+    for module in (pipe.text_encoder, pipe.text_encoder_2, pipe.vae):
+        _, hook = cpu_offload_with_hook(module, device, prev_module_hook=hook)
+
+
+def compile_transformer(pipe):
+    """Compile the transformer once; the server lives long enough to amortize it.
+
+    Shapes are dynamic so every batch size, Kontext resolution and preview
+    size reuses the same kernels instead of recompiling mid-request. With
+    CUDA_GRAPHS, inductor also captures a CUDA graph per input shape and
+    replays it on later calls with the same (height, width, batch).
+    """
+    pipe.transformer = torch.compile(
+        pipe.transformer,
+        mode="max-autotune" if CUDA_GRAPHS else "max-autotune-no-cudagraphs",
+        fullgraph=False,
+        dynamic=True,
+    )
+
+
+def warmup_pipeline(pipe):
+    """Run edits so compilation happens before the first real request.
+
+    Dynamic shapes still specialize a batch of one, so batch 1 and (when
+    batching is enabled) batch 2 are compiled; every larger batch and every
+    resolution reuses the batch-2 graph.
+    """
+    logger.info("Warming up pipeline (compiling transformer)...")
+    dummy_image = Image.new("RGB", (512, 512))
+    for batch_size in sorted({1, min(2, BATCH_SIZE)}):
+        pipe(
+            image=[dummy_image] * batch_size,
+            prompt=["warmup"] * batch_size,
+            guidance_scale=2.5,
+            # Two transformer calls per shape compile it and record its graph
+            num_inference_steps=2,
+        )
+    logger.info("Warmup complete")
+
+
+def configure_torch_backends():
+    """Enable TF32 tensor-core math and cuDNN autotuning."""
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    torch.backends.cudnn.benchmark = True
+
+
+def pipeline_dtype() -> torch.dtype:
+    """Dtype the pipeline is loaded in, from TORCH_DTYPE and QUANT."""
+    # CublasLinear is fp16-only; text embeddings and latents must match it
+    if QUANT.lower() == "cublas_hgemm":
+        return torch.float16
+
+    dtype_map = {
+        "bfloat16": torch.bfloat16,
+        "float16": torch.float16,
+        "float32": torch.float32,
+    }
+    return dtype_map.get(TORCH_DTYPE, torch.bfloat16)
+
+
+def load_torch_pipeline(device: str):
+    """Load the PyTorch diffusers pipeline with the configured quantization."""
+    torch_dtype = pipeline_dtype()
+
+    quant = QUANT.lower()
+    if quant not in ("nf4", "int8", "fp8", "bf16", "cublas_hgemm", *LOW_PRECISION_MODES):
+        raise ValueError(f"Unsupported QUANT mode: {QUANT}")
+
+    if quant == "cublas_hgemm" and TORCH_DTYPE != "float16":
+        logger.info(f"QUANT=cublas_hgemm loads the pipeline in float16 (ignoring TORCH_DTYPE={TORCH_DTYPE})")
+
+    # NF4 weights are quantized while loading, torchao modes afterwards
+    pipeline_kwargs = {}
+    if quant == "nf4":
+        pipeline_kwargs["transformer"] = load_nf4_transformer(torch_dtype)
+
+    torch_pipe = FluxKontextPipeline.from_pretrained(
+        MODEL_PATH, torch_dtype=torch_dtype, **pipeline_kwargs
+    )
+    if quant in ("int8", "fp8"):
+        quantize_pipeline(torch_pipe, quant, device)
+
+    # NHWC layout lets the VAE convolutions use tensor cores
+    torch_pipe.vae.to(memory_format=torch.channels_last)
+    torch_pipe.transformer.to(memory_format=torch.channels_last)
+
+    # FP8/FP4 kernels are quantized on the GPU they will run on, before the
+    # rest of the pipeline joins it: the unquantized pipeline may not fit
+    torch_pipe.transformer.to(device)
+    if quant in LOW_PRECISION_MODES:
+        quantize_transformer_low_precision(torch_pipe, quant, device)
+
+    if OFFLOAD_TEXT_ENCODERS and device.startswith("cuda"):
+        # Hooks keep T5/CLIP off the GPU except while they encode
+        offload_text_encoders(torch_pipe, device)
+    else:
+        for module in (torch_pipe.text_encoder, torch_pipe.text_encoder_2, torch_pipe.vae):
+            module.to(device)
+
+    if quant == "cublas_hgemm":
+        replace_with_cublas_linear(torch_pipe)
+
+    if TORCH_COMPILE and device.startswith("cuda"):
+        compile_transformer(torch_pipe)
+        gpu_executor.submit(warmup_pipeline, torch_pipe).result()
+
+    logger.info(f"Quantization: {quant}")
+    return torch_pipe
+
+
 def load_model():
     """Load the model synchronously."""
     global pipe, model_loaded
@@ -94,19 +445,10 @@ def load_model():
 
         # Determine device
         device = DEVICE or ("cuda" if torch.cuda.is_available() else "cpu")
+        configure_torch_backends()
 
         # Load model
-        dtype_map = {
-            "bfloat16": torch.bfloat16,
-            "float16": torch.float16,
-            "float32": torch.float32,
-        }
-        torch_dtype = dtype_map.get(TORCH_DTYPE, torch.bfloat16)
-
-        pipe = FluxKontextPipeline.from_pretrained(
-            MODEL_PATH, torch_dtype=torch_dtype
-        )
-        pipe.to(device)
+        pipe = load_torch_pipeline(device)
 
         model_loaded = True
         logger.info(f"✅ Model loaded successfully on {device}")
@@ -116,25 +458,306 @@ def load_model():
         raise
 
 
-def image_to_base64(image: Image.Image) -> str:
-    """Convert PIL Image to base64 string."""
+def image_to_bytes(image: Image.Image, image_format: str = "PNG") -> bytes:
+    """Encode PIL Image as PNG or WEBP bytes."""
     try:
         buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        return base64.b64encode(buffer.getvalue()).decode()
+        if image_format == "WEBP":
+            image.save(buffer, format="WEBP", quality=95, method=4)
+        else:
+            image.save(buffer, format="PNG")
+        return buffer.getvalue()
     except Exception as e:
-        logger.error(f"Failed to convert image to base64: {e}")
+        logger.error(f"Failed to encode image: {e}")
         raise
 
 
-def base64_to_image(base64_str: str) -> Image.Image:
-    """Convert base64 string to PIL Image."""
+def bytes_to_image(image_data: bytes) -> Image.Image:
+    """Decode image bytes to an RGB PIL Image."""
     try:
-        image_data = base64.b64decode(base64_str)
-        return Image.open(io.BytesIO(image_data))
+        image = Image.open(io.BytesIO(image_data))
+        # JPEG only: let the decoder downscale by a power of two while
+        # staying at or above the model's working resolution
+        image.draft("RGB", (1024, 1024))
+        return image.convert("RGB")
     except Exception as e:
-        logger.error(f"Failed to convert base64 to image: {e}")
-        raise ValueError("Invalid base64 image data")
+        logger.error(f"Failed to convert bytes to image: {e}")
+        raise ValueError("Invalid image data")
+
+
+def response_format(accept: Optional[str]) -> str:
+    """Pick the output format the client accepts, preferring WEBP."""
+    return "WEBP" if accept and "image/webp" in accept else "PNG"
+
+
+def result_cache_key(
+    image_data: bytes,
+    prompt: str,
+    guidance_scale: float,
+    num_inference_steps: int,
+    preview: bool,
+    image_format: str,
+) -> str:
+    """Content address of an edit request and its output format."""
+    return hashlib.blake2b(
+        image_data
+        + prompt.encode()
+        + struct.pack("fi?", guidance_scale, num_inference_steps, preview)
+        + image_format.encode()
+    ).hexdigest()
+
+
+def preview_size(image: Image.Image) -> Tuple[int, int]:
+    """Preview output (height, width) keeping the input's aspect ratio."""
+    aspect_ratio = image.width / image.height
+    # Multiples of 16 (VAE downscale x latent packing)
+    width = round(PREVIEW_RESOLUTION * aspect_ratio ** 0.5 / 16) * 16
+    height = round(PREVIEW_RESOLUTION / aspect_ratio ** 0.5 / 16) * 16
+    return height, width
+
+
+def vram_batch_limit() -> int:
+    """Largest batch that fits in free GPU memory, capped at BATCH_SIZE."""
+    device = DEVICE or ("cuda" if torch.cuda.is_available() else "cpu")
+    if not device.startswith("cuda"):
+        return BATCH_SIZE
+
+    # Blocks cached by PyTorch's allocator are free to us but not to the driver
+    cuda_device = torch.device(device)
+    free_bytes, _ = torch.cuda.mem_get_info(cuda_device)
+    free_bytes += torch.cuda.memory_reserved(cuda_device) - torch.cuda.memory_allocated(cuda_device)
+    fits = int(free_bytes // (BATCH_VRAM_PER_IMAGE_GB * 2**30))
+    return max(1, min(BATCH_SIZE, fits))
+
+
+def attention_context():
+    """Restrict SDPA to the flash and memory-efficient kernels on CUDA."""
+    # The denoising device; pipe.device can be CPU while modules are offloaded
+    if pipe._execution_device.type != "cuda":
+        return contextlib.nullcontext()
+    return sdpa_kernel([SDPBackend.FLASH_ATTENTION, SDPBackend.EFFICIENT_ATTENTION])
+
+
+def encode_prompts(prompts: List[str]) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Batched T5/CLIP embeddings for prompts, skipping the encoders on cache hits."""
+    prompt_embeds, pooled_prompt_embeds = [], []
+    for prompt in prompts:
+        embeds = prompt_cache.get(prompt)
+        if embeds is None:
+            with torch.no_grad():
+                prompt_embed, pooled_prompt_embed, _ = pipe.encode_prompt(
+                    prompt=prompt, prompt_2=None, device=pipe._execution_device
+                )
+            embeds = (prompt_embed, pooled_prompt_embed)
+            prompt_cache.put(prompt, embeds)
+        prompt_embeds.append(embeds[0])
+        pooled_prompt_embeds.append(embeds[1])
+
+    return torch.cat(prompt_embeds), torch.cat(pooled_prompt_embeds)
+
+
+def run_pipeline(jobs: List[EditJob]) -> List[Image.Image]:
+    """Run one batched pipeline call for jobs sharing a batch key.
+
+    Must run on gpu_executor.
+    """
+    logger.info(f"Processing batch of {len(jobs)} edit request(s)")
+
+    pipe_kwargs = {}
+    num_inference_steps = jobs[0].num_inference_steps
+
+    # Resume from stashed latents, or stash them for the next edit of the image
+    stash_step = 0
+    if jobs[0].latent_key and 0 < LATENT_RESUME_STEP < num_inference_steps:
+        if jobs[0].resume_latents is not None:
+            logger.info(f"Resuming denoising from step {LATENT_RESUME_STEP}")
+            sigmas = np.linspace(1.0, 1 / num_inference_steps, num_inference_steps)
+            pipe_kwargs["sigmas"] = sigmas[LATENT_RESUME_STEP:]
+            pipe_kwargs["latents"] = torch.cat([job.resume_latents for job in jobs])
+        else:
+            stash_step = LATENT_RESUME_STEP
+
+    if stash_step or any(job.progress for job in jobs):
+        def on_step_end(pipeline, step, timestep, callback_kwargs):
+            if step + 1 == stash_step:
+                latents = callback_kwargs["latents"]
+                for i, job in enumerate(jobs):
+                    latent_cache.put(job.latent_key, latents[i:i + 1].clone())
+            for job in jobs:
+                if job.progress:
+                    job.progress(step + 1, pipeline.num_timesteps)
+            return callback_kwargs
+
+        pipe_kwargs["callback_on_step_end"] = on_step_end
+
+    prompt_embeds, pooled_prompt_embeds = encode_prompts([job.prompt for job in jobs])
+
+    if jobs[0].output_size:
+        height, width = jobs[0].output_size
+        # Kontext rescales the output to max_area, so pin it to the size
+        pipe_kwargs.update(height=height, width=width, max_area=height * width)
+
+    with attention_context():
+        result = pipe(
+            image=[job.image for job in jobs],
+            guidance_scale=jobs[0].guidance_scale,
+            num_inference_steps=num_inference_steps,
+            prompt_embeds=prompt_embeds,
+            pooled_prompt_embeds=pooled_prompt_embeds,
+            **pipe_kwargs
+        )
+    return result.images
+
+
+async def run_batch(jobs: List[EditJob]):
+    """Run a batch off the event loop and deliver results to each job."""
+    try:
+        loop = asyncio.get_running_loop()
+        images = await loop.run_in_executor(gpu_executor, run_pipeline, jobs)
+    except Exception as e:
+        logger.error(f"Batch of {len(jobs)} failed: {e}")
+        for job in jobs:
+            if not job.future.done():
+                job.future.set_exception(e)
+        return
+
+    for job, image in zip(jobs, images):
+        if not job.future.done():
+            job.future.set_result(image)
+
+
+async def batch_worker():
+    """Collect queued jobs for up to BATCH_WAIT_MS and run them in batches."""
+    loop = asyncio.get_running_loop()
+
+    while True:
+        jobs = [await edit_queue.get()]
+        try:
+            deadline = loop.time() + BATCH_WAIT_MS / 1000
+            limit = vram_batch_limit()
+
+            while len(jobs) < limit:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    jobs.append(await asyncio.wait_for(edit_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            groups: Dict[Any, List[EditJob]] = {}
+            for job in jobs:
+                groups.setdefault(job.batch_key, []).append(job)
+
+            for group in groups.values():
+                await run_batch(group)
+        except Exception as e:
+            # Keep serving later requests; only this round's jobs fail
+            logger.error(f"Batch worker failed: {e}")
+            for job in jobs:
+                if not job.future.done():
+                    job.future.set_exception(e)
+
+
+async def submit_edit(
+    image: Image.Image,
+    prompt: str,
+    guidance_scale: float,
+    num_inference_steps: int,
+    output_size: Optional[Tuple[int, int]] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    latent_key: Optional[Tuple] = None,
+) -> Image.Image:
+    """Queue an edit for the batch worker and wait for the edited image."""
+    future = asyncio.get_running_loop().create_future()
+    resume_latents = latent_cache.get(latent_key) if latent_key else None
+    await edit_queue.put(EditJob(
+        image=image,
+        prompt=prompt,
+        guidance_scale=guidance_scale,
+        num_inference_steps=num_inference_steps,
+        output_size=output_size,
+        future=future,
+        progress=progress,
+        latent_key=latent_key,
+        resume_latents=resume_latents,
+    ))
+    return await future
+
+
+def validate_edit_request(
+    image_data: bytes, prompt: str, guidance_scale: float, num_inference_steps: int
+):
+    """Raise HTTPException if an edit request is invalid or cannot be served."""
+    if not image_data:
+        raise HTTPException(status_code=400, detail="image cannot be empty")
+    if not prompt:
+        raise HTTPException(status_code=400, detail="prompt cannot be empty")
+    if not (0.1 <= guidance_scale <= 10.0):
+        raise HTTPException(status_code=400, detail="guidance_scale must be between 0.1 and 10.0")
+    if not (1 <= num_inference_steps <= 100):
+        raise HTTPException(status_code=400, detail="num_inference_steps must be between 1 and 100")
+
+    # Check if model is loaded
+    if not model_loaded:
+        raise HTTPException(status_code=503, detail="Model not loaded. Please restart the server.")
+
+
+async def process_edit(
+    image_data: bytes,
+    prompt: str,
+    guidance_scale: float,
+    num_inference_steps: int,
+    preview: bool,
+    image_format: str,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> bytes:
+    """Edit an encoded image, going through the result cache.
+
+    Previews run PREVIEW_INFERENCE_STEPS steps at a lower output resolution
+    regardless of ``num_inference_steps``.
+    """
+    # Identical requests are served from the result cache
+    cache_key = result_cache_key(
+        image_data, prompt, guidance_scale, num_inference_steps, preview, image_format
+    )
+    cached_result = result_cache.get(cache_key)
+    if cached_result is not None:
+        logger.info(f"Serving cached result for: '{prompt}'")
+        return cached_result
+
+    # Process image; decoding and encoding stay off the event loop
+    input_image = await asyncio.to_thread(bytes_to_image, image_data)
+
+    output_size = None
+    if preview:
+        num_inference_steps = PREVIEW_INFERENCE_STEPS
+        output_size = preview_size(input_image)
+
+    # Edits of the same image with the same settings can share early steps
+    latent_key = None
+    if LATENT_RESUME_STEP > 0:
+        latent_key = (
+            hashlib.sha256(image_data).hexdigest(),
+            guidance_scale,
+            num_inference_steps,
+            output_size,
+        )
+
+    logger.info(f"Queueing image edit request: '{prompt}'")
+    edited_image = await submit_edit(
+        input_image,
+        prompt,
+        guidance_scale,
+        num_inference_steps,
+        output_size,
+        progress,
+        latent_key,
+    )
+    result_data = await asyncio.to_thread(image_to_bytes, edited_image, image_format)
+    result_cache.put(cache_key, result_data)
+
+    return result_data
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -156,43 +779,42 @@ async def get_model_info():
         model_name="FLUX.1-Kontext-dev",
         model_path=MODEL_PATH,
         device=device,
-        torch_dtype=TORCH_DTYPE,
+        torch_dtype=str(pipeline_dtype()).replace("torch.", ""),
+        quant=QUANT,
         loaded=model_loaded
     )
 
 
-@app.post("/edit_image", response_model=EditImageResponse)
-async def edit_image(request: EditImageRequest):
-    """Edit an image based on a text prompt using FLUX Kontext model."""
+@app.post("/edit_image", response_class=Response)
+async def edit_image(
+    prompt: str = Form(...),
+    guidance_scale: float = Form(2.5),
+    num_inference_steps: int = Form(DEFAULT_INFERENCE_STEPS),
+    preview: bool = Form(False),
+    image: UploadFile = File(...),
+    accept: Optional[str] = Header(None),
+):
+    """Edit an uploaded image based on a text prompt.
+
+    The result is returned as WEBP if the client's Accept header allows it,
+    PNG otherwise.
+    """
     global pipe, model_loaded
     
     try:
-        # Validation
-        if not request.image_base64:
-            raise HTTPException(status_code=400, detail="image_base64 cannot be empty")
-        if not request.prompt:
-            raise HTTPException(status_code=400, detail="prompt cannot be empty")
-        if not (0.1 <= request.guidance_scale <= 10.0):
-            raise HTTPException(status_code=400, detail="guidance_scale must be between 0.1 and 10.0")
-
-        # Check if model is loaded
-        if not model_loaded:
-            raise HTTPException(status_code=503, detail="Model not loaded. Please restart the server.")
-
-        # Process image
-        input_image = base64_to_image(request.image_base64)
-        
-        logger.info(f"Processing image edit request: '{request.prompt}'")
-        result = pipe(
-            image=input_image,
-            prompt=request.prompt,
-            guidance_scale=request.guidance_scale
+        image_data = await image.read()
+        validate_edit_request(image_data, prompt, guidance_scale, num_inference_steps)
+
+        image_format = response_format(accept)
+        result_data = await process_edit(
+            image_data, prompt, guidance_scale, num_inference_steps, preview, image_format
         )
 
-        edited_image = result.images[0]
-        result_base64 = image_to_base64(edited_image)
-        
-        return EditImageResponse(result=result_base64)
+        return Response(
+            content=result_data,
+            media_type=f"image/{image_format.lower()}",
+            headers={"Vary": "Accept"},
+        )
 
     except HTTPException:
         raise
@@ -201,12 +823,78 @@ async def edit_image(request: EditImageRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.websocket("/ws/edit")
+async def edit_image_ws(websocket: WebSocket):
+    """Edit an image over a WebSocket, streaming denoising progress.
+
+    The client sends a JSON message with ``prompt`` and optionally
+    ``guidance_scale``, ``num_inference_steps``, ``preview`` and ``format``
+    (``png`` or ``webp``), then the image as a binary
+    message. The server replies with ``{"step": i, "total": n}`` messages
+    followed by the edited image as a binary message, or ``{"error": ...}``.
+    """
+    await websocket.accept()
+    loop = asyncio.get_running_loop()
+    progress_queue = asyncio.Queue()
+
+    async def send_progress():
+        # Sends one message at a time so progress stays in step order
+        while (update := await progress_queue.get()) is not None:
+            step, total = update
+            await websocket.send_json({"step": step, "total": total})
+
+    def report_progress(step: int, total: int):
+        loop.call_soon_threadsafe(progress_queue.put_nowait, (step, total))
+
+    try:
+        params = await websocket.receive_json()
+        image_data = await websocket.receive_bytes()
+
+        prompt = params.get("prompt", "")
+        guidance_scale = float(params.get("guidance_scale", 2.5))
+        num_inference_steps = int(params.get("num_inference_steps", DEFAULT_INFERENCE_STEPS))
+        preview = bool(params.get("preview", False))
+        image_format = "WEBP" if params.get("format", "png").lower() == "webp" else "PNG"
+        validate_edit_request(image_data, prompt, guidance_scale, num_inference_steps)
+
+        sender = asyncio.create_task(send_progress())
+        try:
+            result_data = await process_edit(
+                image_data,
+                prompt,
+                guidance_scale,
+                num_inference_steps,
+                preview,
+                image_format,
+                report_progress,
+            )
+        finally:
+            progress_queue.put_nowait(None)
+            await sender
+
+        await websocket.send_bytes(result_data)
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        logger.info("WebSocket client disconnected")
+    except HTTPException as e:
+        await websocket.send_json({"error": e.detail})
+        await websocket.close()
+    except Exception as e:
+        logger.error(f"Error in edit_image_ws: {e}")
+        await websocket.send_json({"error": str(e)})
+        await websocket.close()
+
+
 @app.on_event("startup")
 async def startup_event():
-    """Load model on startup."""
+    """Load model and start the batch worker on startup."""
+    global edit_queue, batch_worker_task
     logger.info("🚀 Server starting up...")
     try:
         load_model()
+        edit_queue = asyncio.Queue()
+        batch_worker_task = asyncio.create_task(batch_worker())
         logger.info("✅ Server ready!")
     except Exception as e:
         logger.error(f"❌ Failed to start server: {e}")
@@ -219,6 +907,14 @@ def signal_handler(signum, frame):
     sys.exit(0)
 
 
+def is_socket(path: str) -> bool:
+    """Whether path is a UNIX socket file (not following symlinks)."""
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
 def main():
     """Main entry point."""
     # Handle shutdown signals
@@ -228,16 +924,36 @@ def main():
     logger.info("🎨 Starting Persistent AI Image Editor Server")
     logger.info(f"Model path: {MODEL_PATH}")
     logger.info(f"Device: {DEVICE or 'auto-detect'}")
+    logger.info(f"Quantization: {QUANT}")
     logger.info(f"Server will run on: http://{SERVER_HOST}:{SERVER_PORT}")
     
     # Run the server
-    uvicorn.run(
+    config = uvicorn.Config(
         "server:app",
         host=SERVER_HOST,
         port=SERVER_PORT,
         log_level=LOG_LEVEL.lower(),
+        # "auto" picks uvloop and httptools when uvicorn[standard] installed them
+        loop="auto",
+        http="auto",
         reload=False
     )
+    sockets = [config.bind_socket()]
+
+    # One server listening on both sockets, so both share the loaded model
+    if SERVER_UDS:
+        logger.info(f"Server will also run on UNIX socket: {SERVER_UDS}")
+        # A socket left by a crashed run; any other file is not ours to delete
+        if is_socket(SERVER_UDS):
+            os.unlink(SERVER_UDS)
+        sockets.append(uvicorn.Config("server:app", uds=SERVER_UDS).bind_socket())
+
+    try:
+        uvicorn.Server(config).run(sockets=sockets)
+    finally:
+        # Clients pick the socket whenever the file exists
+        if SERVER_UDS and is_socket(SERVER_UDS):
+            os.unlink(SERVER_UDS)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+import http.client
+import json
+import os
+
+import launcher
+
+
+class FakeResponse:
+    def __init__(self, status, body):
+        self.status = status
+        self._body = body
+
+    def read(self):
+        return self._body
+
+
+class FakeConnection:
+    """HTTPConnection double that replays a list of responses or errors."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = 0
+        self.closed = 0
+
+    def request(self, method, url):
+        assert (method, url) == ("GET", "/health")
+        self.requests += 1
+
+    def getresponse(self):
+        response = self.responses.pop(0) if self.responses else OSError("refused")
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def close(self):
+        self.closed += 1
+
+
+def health(ready, status=200):
+    return FakeResponse(status, json.dumps({"ready": ready}).encode())
+
+
+def test_probe_health_ready():
+    assert launcher.probe_health(FakeConnection([health(True)]))
+
+
+def test_probe_health_not_ready():
+    assert not launcher.probe_health(FakeConnection([health(False)]))
+    assert not launcher.probe_health(FakeConnection([health(True, status=503)]))
+
+
+def test_probe_health_closes_connection_on_error():
+    for error in (ConnectionRefusedError(), http.client.RemoteDisconnected(),
+                  FakeResponse(200, b"not json")):
+        connection = FakeConnection([error])
+        assert not launcher.probe_health(connection)
+        assert connection.closed == 1
+
+
+def patch_clock(monkeypatch, connection):
+    clock = [0.0]
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(launcher.time, "time", lambda: clock[0])
+    monkeypatch.setattr(launcher.time, "sleep", fake_sleep)
+    monkeypatch.setattr(launcher.http.client, "HTTPConnection",
+                        lambda *args, **kwargs: connection)
+    return sleeps
+
+
+def test_wait_for_server_backs_off_until_ready(monkeypatch):
+    connection = FakeConnection([OSError(), health(False), health(True)])
+    sleeps = patch_clock(monkeypatch, connection)
+
+    assert launcher.wait_for_server()
+    assert sleeps == [0.2, 0.2 * 1.5]
+    assert connection.requests == 3
+    assert connection.closed == 2
+
+
+def test_wait_for_server_caps_backoff_and_times_out(monkeypatch):
+    connection = FakeConnection([])
+    sleeps = patch_clock(monkeypatch, connection)
+
+    assert not launcher.wait_for_server(timeout=60)
+    assert max(sleeps) == 8.0
+    assert sleeps == sorted(sleeps)
+    assert sum(sleeps[:-1]) < 60 <= sum(sleeps)
+
+
+def test_default_uds_path_uses_runtime_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert launcher.default_uds_path() == str(tmp_path / "img_editor.sock")
+
+
+def test_default_uds_path_creates_private_dir(monkeypatch, tmp_path):
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setattr(launcher.tempfile, "gettempdir", lambda: str(tmp_path))
+
+    path = launcher.default_uds_path()
+    runtime_dir = tmp_path / f"img_editor-{os.getuid()}"
+    assert path == str(runtime_dir / "img_editor.sock")
+    assert runtime_dir.stat().st_mode & 0o777 == 0o700
+
+
+def test_default_uds_path_rejects_shared_dir(monkeypatch, tmp_path):
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setattr(launcher.tempfile, "gettempdir", lambda: str(tmp_path))
+    runtime_dir = tmp_path / f"img_editor-{os.getuid()}"
+    runtime_dir.mkdir()
+    runtime_dir.chmod(0o777)
+
+    assert launcher.default_uds_path() == ""
@@ -0,0 +1,278 @@
+import asyncio
+import socket
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+import server
+from server import LRUCache, preview_size, result_cache_key
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_lru_cache_disabled_with_zero_size():
+    cache = LRUCache(0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_result_cache_key_covers_every_field():
+    args = (b"image", "make it blue", 2.5, 28, False, "png")
+    key = result_cache_key(*args)
+    assert key == result_cache_key(*args)
+
+    for i, value in enumerate((b"other", "make it red", 3.0, 8, True, "webp")):
+        changed = list(args)
+        changed[i] = value
+        assert result_cache_key(*changed) != key
+
+
+def test_preview_size_square():
+    assert preview_size(Image.new("RGB", (2048, 2048))) == (768, 768)
+
+
+def test_preview_size_keeps_aspect_ratio():
+    height, width = preview_size(Image.new("RGB", (1920, 1080)))
+    assert height % 16 == 0 and width % 16 == 0
+    assert abs(width / height - 1920 / 1080) < 0.05
+    assert abs(width * height - 768 * 768) / (768 * 768) < 0.05
+
+
+def test_require_compute_capability_checks_configured_device(monkeypatch):
+    devices = []
+
+    def fake_capability(device):
+        devices.append(device)
+        return (9, 0)
+
+    monkeypatch.setattr(server.torch.cuda, "is_available", lambda: True)
+    monkeypatch.setattr(server.torch.cuda, "get_device_capability", fake_capability)
+
+    server.require_compute_capability("fp8_rowwise", "cuda:1")
+    assert devices == [torch.device("cuda:1")]
+
+    with pytest.raises(RuntimeError, match="sm_100"):
+        server.require_compute_capability("nvfp4", "cuda:1")
+    with pytest.raises(RuntimeError, match="CUDA GPU"):
+        server.require_compute_capability("fp8", "cpu")
+
+
+def test_is_socket_only_matches_unix_sockets(tmp_path):
+    socket_path = tmp_path / "server.sock"
+    listener = socket.socket(socket.AF_UNIX)
+    listener.bind(str(socket_path))
+    regular_file = tmp_path / "notes.txt"
+    regular_file.write_text("keep me")
+
+    try:
+        assert server.is_socket(str(socket_path))
+        assert not server.is_socket(str(regular_file))
+        assert not server.is_socket(str(tmp_path / "missing.sock"))
+    finally:
+        listener.close()
+
+
+def test_batch_worker_groups_jobs_by_batch_key(monkeypatch):
+    batches = []
+
+    def fake_run_pipeline(jobs):
+        batches.append([job.prompt for job in jobs])
+        return [job.image for job in jobs]
+
+    monkeypatch.setattr(server, "run_pipeline", fake_run_pipeline)
+    monkeypatch.setattr(server, "vram_batch_limit", lambda: 8)
+    monkeypatch.setattr(server, "BATCH_WAIT_MS", 200)
+
+    small = Image.new("RGB", (64, 64))
+    large = Image.new("RGB", (128, 128))
+
+    async def run():
+        monkeypatch.setattr(server, "edit_queue", asyncio.Queue())
+        worker = asyncio.create_task(server.batch_worker())
+        try:
+            return await asyncio.gather(
+                server.submit_edit(small, "a", 2.5, 28),
+                server.submit_edit(large, "b", 2.5, 28),
+                server.submit_edit(small, "c", 2.5, 28),
+                server.submit_edit(small, "d", 2.5, 8),
+                server.submit_edit(small, "e", 2.5, 28),
+            )
+        finally:
+            worker.cancel()
+
+    results = asyncio.run(run())
+
+    assert results == [small, large, small, small, small]
+    assert sorted(batches) == [["a", "c", "e"], ["b"], ["d"]]
+
+
+def test_batch_worker_survives_failed_round(monkeypatch):
+    limits = iter([RuntimeError("bad device"), 8])
+
+    def flaky_vram_batch_limit():
+        limit = next(limits)
+        if isinstance(limit, Exception):
+            raise limit
+        return limit
+
+    monkeypatch.setattr(server, "run_pipeline", lambda jobs: [job.image for job in jobs])
+    monkeypatch.setattr(server, "vram_batch_limit", flaky_vram_batch_limit)
+
+    image = Image.new("RGB", (64, 64))
+
+    async def run():
+        monkeypatch.setattr(server, "edit_queue", asyncio.Queue())
+        worker = asyncio.create_task(server.batch_worker())
+        try:
+            with pytest.raises(RuntimeError, match="bad device"):
+                await server.submit_edit(image, "a", 2.5, 28)
+            return await server.submit_edit(image, "b", 2.5, 28)
+        finally:
+            worker.cancel()
+
+    assert asyncio.run(run()) is image
+
+
+class FakePipeline:
+    """Stands in for the Kontext pipeline, adding 1 to the latents per step."""
+
+    _execution_device = torch.device("cpu")
+
+    def __init__(self):
+        self.calls = []
+        self.encoded = []
+        self.num_timesteps = 0
+
+    def encode_prompt(self, prompt, prompt_2, device):
+        # Embeddings filled with the prompt's character code identify it
+        self.encoded.append(prompt)
+        code = float(ord(prompt))
+        return torch.full((1, 2, 1), code), torch.full((1, 1), code), None
+
+    def __call__(self, image, num_inference_steps, **kwargs):
+        self.calls.append(kwargs)
+        self.num_timesteps = len(kwargs.get("sigmas", range(num_inference_steps)))
+        latents = kwargs.get("latents")
+        if latents is None:
+            latents = torch.arange(len(image), dtype=torch.float32).view(-1, 1)
+        callback = kwargs.get("callback_on_step_end")
+        for step in range(self.num_timesteps):
+            latents = latents + 1
+            if callback:
+                callback(self, step, None, {"latents": latents})
+        return SimpleNamespace(images=list(image))
+
+
+def make_job(prompt, num_inference_steps=10, **kwargs):
+    return server.EditJob(
+        image=Image.new("RGB", (64, 64)),
+        prompt=prompt,
+        guidance_scale=2.5,
+        num_inference_steps=num_inference_steps,
+        output_size=None,
+        future=None,
+        **kwargs,
+    )
+
+
+def use_fake_pipeline(monkeypatch, resume_step=3):
+    fake = FakePipeline()
+    monkeypatch.setattr(server, "pipe", fake)
+    monkeypatch.setattr(server, "LATENT_RESUME_STEP", resume_step)
+    monkeypatch.setattr(server, "latent_cache", LRUCache(8))
+    monkeypatch.setattr(server, "prompt_cache", LRUCache(8))
+    return fake
+
+
+def test_run_pipeline_stashes_latents_per_job(monkeypatch):
+    fake = use_fake_pipeline(monkeypatch)
+    progress = []
+    jobs = [
+        make_job("a", latent_key=("a",), progress=lambda *p: progress.append(p)),
+        make_job("b", latent_key=("b",)),
+    ]
+
+    server.run_pipeline(jobs)
+
+    assert "sigmas" not in fake.calls[0]
+    assert torch.equal(server.latent_cache.get(("a",)), torch.tensor([[3.0]]))
+    assert torch.equal(server.latent_cache.get(("b",)), torch.tensor([[4.0]]))
+    assert progress == [(step, 10) for step in range(1, 11)]
+
+
+def test_run_pipeline_resumes_from_stashed_latents(monkeypatch):
+    fake = use_fake_pipeline(monkeypatch)
+    progress = []
+    jobs = [
+        make_job("a", latent_key=("a",), resume_latents=torch.tensor([[3.0]]),
+                 progress=lambda *p: progress.append(p)),
+        make_job("b", latent_key=("b",), resume_latents=torch.tensor([[4.0]])),
+    ]
+
+    server.run_pipeline(jobs)
+
+    kwargs = fake.calls[0]
+    np.testing.assert_allclose(kwargs["sigmas"], np.linspace(1.0, 0.1, 10)[3:])
+    assert torch.equal(kwargs["latents"], torch.tensor([[3.0], [4.0]]))
+    assert server.latent_cache.get(("a",)) is None
+    assert progress == [(step, 7) for step in range(1, 8)]
+
+
+def test_run_pipeline_skips_latents_when_resume_step_not_below_steps(monkeypatch):
+    fake = use_fake_pipeline(monkeypatch, resume_step=8)
+    jobs = [make_job("a", num_inference_steps=8, latent_key=("a",),
+                     resume_latents=torch.tensor([[3.0]]))]
+
+    server.run_pipeline(jobs)
+
+    assert "sigmas" not in fake.calls[0] and "latents" not in fake.calls[0]
+    assert "callback_on_step_end" not in fake.calls[0]
+    assert server.latent_cache.get(("a",)) is None
+
+
+
+
+def test_encode_prompts_runs_encoders_once_per_prompt(monkeypatch):
+    fake = use_fake_pipeline(monkeypatch)
+
+    prompt_embeds, pooled_prompt_embeds = server.encode_prompts(["a", "b", "a"])
+    server.encode_prompts(["b", "c"])
+
+    assert fake.encoded == ["a", "b", "c"]
+    assert prompt_embeds.shape == (3, 2, 1)
+    assert prompt_embeds[:, 0, 0].tolist() == [ord("a"), ord("b"), ord("a")]
+    assert pooled_prompt_embeds[:, 0].tolist() == [ord("a"), ord("b"), ord("a")]
+
+
+def test_run_pipeline_passes_embeddings_in_job_order(monkeypatch):
+    fake = use_fake_pipeline(monkeypatch, resume_step=0)
+
+    server.run_pipeline([make_job("b"), make_job("a"), make_job("b")])
+
+    kwargs = fake.calls[0]
+    assert "prompt" not in kwargs
+    assert kwargs["prompt_embeds"][:, 0, 0].tolist() == [ord("b"), ord("a"), ord("b")]
+    assert kwargs["pooled_prompt_embeds"][:, 0].tolist() == [ord("b"), ord("a"), ord("b")]
+    assert fake.encoded == ["b", "a"]
+
+
+def test_model_info_reports_pipeline_dtype(monkeypatch):
+    monkeypatch.setattr(server, "TORCH_DTYPE", "bfloat16")
+    monkeypatch.setattr(server, "QUANT", "cublas_hgemm")
+    assert asyncio.run(server.get_model_info()).torch_dtype == "float16"
+
+    monkeypatch.setattr(server, "QUANT", "bf16")
+    assert asyncio.run(server.get_model_info()).torch_dtype == "bfloat16"
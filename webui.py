@@ -4,30 +4,70 @@ Connects to the persistent HTTP server (no new processes).
 """
 
 import asyncio
-import base64
 import io
+import json
 import logging
-import requests
+import os
 import time
 from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import urlparse
 
+import httpx
 import streamlit as st
 from PIL import Image
+from websockets.sync.client import connect, unix_connect
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+@st.cache_data(ttl=5)
+def get_server_health(_app: "PersistentWebUI"):
+    """Server health, reused by reruns within 5 seconds of the last check."""
+    return _app.check_server_health()
+
+
 class PersistentWebUI:
     """WebUI that connects to persistent HTTP server."""
 
-    def __init__(self, server_url: str = "http://localhost:8888"):
+    def __init__(
+        self,
+        server_url: str = "http://localhost:8888",
+        uds_path: Optional[str] = os.getenv("SERVER_UDS")
+    ):
         self.server_url = server_url.rstrip('/')
 
+        # A co-located server is reached over its UNIX socket, skipping TCP
+        is_local = urlparse(self.server_url).hostname in ("localhost", "127.0.0.1")
+        self.uds_path = None
+        self.session = self._create_client(None)
+
+        if uds_path and is_local and os.path.exists(uds_path):
+            uds_session = self._create_client(uds_path)
+            try:
+                uds_session.get(f"{self.server_url}/health", timeout=2)
+                self.session.close()
+                self.session, self.uds_path = uds_session, uds_path
+            except httpx.TransportError as e:
+                # Stale socket file from an earlier run; stay on TCP
+                logger.warning(f"UNIX socket {uds_path} unusable, using TCP: {e}")
+                uds_session.close()
+
+    @staticmethod
+    def _create_client(uds_path: Optional[str]) -> httpx.Client:
+        """HTTP client reusing keep-alive connections across health/info polls."""
+        return httpx.Client(
+            transport=httpx.HTTPTransport(
+                uds=uds_path,
+                limits=httpx.Limits(max_connections=8, max_keepalive_connections=4)
+            )
+        )
+
     def check_server_health(self):
         """Check if the server is healthy and ready."""
         try:
-            response = requests.get(f"{self.server_url}/health", timeout=5)
+            response = self.session.get(f"{self.server_url}/health", timeout=5)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -36,37 +76,47 @@ class PersistentWebUI:
             logger.error(f"Health check failed: {e}")
             return None
 
-    def edit_image(self, image: Image.Image, prompt: str, guidance_scale: float):
-        """Edit image using the persistent HTTP server."""
+    def edit_image(
+        self,
+        image_data: bytes,
+        prompt: str,
+        guidance_scale: float,
+        num_inference_steps: int = 28,
+        preview: bool = False,
+        image_format: str = "png",
+        on_progress: Optional[Callable[[int, int], None]] = None
+    ):
+        """Edit image over the server's WebSocket, reporting denoising progress."""
+        ws_url = "ws" + self.server_url[len("http"):] + "/ws/edit"
         try:
-            # Convert image to base64
-            buffer = io.BytesIO()
-            image.save(buffer, format="PNG")
-            image_base64 = base64.b64encode(buffer.getvalue()).decode()
-            
-            # Send request to server
-            payload = {
-                "image_base64": image_base64,
-                "prompt": prompt,
-                "guidance_scale": guidance_scale
-            }
-            
-            response = requests.post(
-                f"{self.server_url}/edit_image",
-                json=payload,
-                timeout=300  # 5 minutes timeout
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                result_base64 = result["result"]
-                
-                # Convert back to image
-                image_data = base64.b64decode(result_base64)
-                return Image.open(io.BytesIO(image_data))
+            if self.uds_path:
+                websocket_connection = unix_connect(
+                    self.uds_path, ws_url, max_size=None, open_timeout=10
+                )
             else:
-                error_msg = response.json().get("detail", "Unknown error")
-                raise Exception(f"Server error: {error_msg}")
+                websocket_connection = connect(ws_url, max_size=None, open_timeout=10)
+
+            with websocket_connection as websocket:
+                # Parameters first, then the original file bytes
+                websocket.send(json.dumps({
+                    "prompt": prompt,
+                    "guidance_scale": guidance_scale,
+                    "num_inference_steps": num_inference_steps,
+                    "preview": preview,
+                    "format": image_format
+                }))
+                websocket.send(image_data)
+
+                while True:
+                    message = websocket.recv(timeout=300)  # 5 minutes per message
+                    if isinstance(message, bytes):
+                        return Image.open(io.BytesIO(message))
+
+                    update = json.loads(message)
+                    if "error" in update:
+                        raise Exception(f"Server error: {update['error']}")
+                    if on_progress:
+                        on_progress(update["step"], update["total"])
                 
         except Exception as e:
             logger.error(f"Error editing image: {e}")
@@ -75,7 +125,7 @@ class PersistentWebUI:
     def get_server_info(self):
         """Get server information."""
         try:
-            response = requests.get(f"{self.server_url}/model_info", timeout=5)
+            response = self.session.get(f"{self.server_url}/model_info", timeout=5)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -95,6 +145,8 @@ class PersistentWebUI:
         # Initialize session state
         if 'original_image' not in st.session_state:
             st.session_state.original_image = None
+        if 'original_image_data' not in st.session_state:
+            st.session_state.original_image_data = None
         if 'edited_image' not in st.session_state:
             st.session_state.edited_image = None
         if 'is_processing' not in st.session_state:
@@ -105,7 +157,7 @@ class PersistentWebUI:
         st.write("Upload an image and describe how you want to edit it!")
 
         # Server status banner
-        health = self.check_server_health()
+        health = get_server_health(self)
         if health and health.get("ready"):
             st.success(f"✅ Server is ready and model is loaded")
         else:
@@ -118,6 +170,7 @@ class PersistentWebUI:
             
             # Real-time server status
             if st.button("🔄 Refresh Status"):
+                get_server_health.clear()
                 st.rerun()
             
             if health:
@@ -136,6 +189,27 @@ class PersistentWebUI:
                 help="Higher values follow the prompt more closely"
             )
             
+            num_inference_steps = st.slider(
+                "Inference Steps",
+                min_value=1,
+                max_value=50,
+                value=28,
+                step=1,
+                help="More steps give finer detail; time grows linearly with steps"
+            )
+            
+            preview = st.toggle(
+                "⚡ Quick preview",
+                value=False,
+                help="8 steps at lower resolution to iterate on prompts quickly"
+            )
+            
+            fast_transfer = st.toggle(
+                "📦 Lossy WEBP transfer",
+                value=False,
+                help="Smaller, faster responses; downloads are then re-encoded from a lossy image"
+            )
+            
             # Model info
             if st.button("📊 Model Info"):
                 info = self.get_server_info()
@@ -172,6 +246,7 @@ class PersistentWebUI:
             )
             
             if uploaded_file is not None:
+                st.session_state.original_image_data = uploaded_file.getvalue()
                 st.session_state.original_image = Image.open(uploaded_file)
                 st.image(
                     st.session_state.original_image,
@@ -193,12 +268,21 @@ class PersistentWebUI:
                     if prompt.strip():
                         st.session_state.is_processing = True
                         
+                        progress_bar = st.progress(0.0, text="🔄 Processing your image...")
+
+                        def show_progress(step, total):
+                            progress_bar.progress(step / total, text=f"🔄 Denoising step {step}/{total}")
+
                         with st.spinner("🔄 Processing your image... This should be fast!"):
                             try:
                                 edited_image = self.edit_image(
-                                    st.session_state.original_image,
+                                    st.session_state.original_image_data,
                                     prompt,
-                                    guidance_scale
+                                    guidance_scale,
+                                    num_inference_steps=num_inference_steps,
+                                    preview=preview,
+                                    image_format="webp" if fast_transfer else "png",
+                                    on_progress=show_progress
                                 )
                                 
                                 if edited_image:
@@ -251,6 +335,13 @@ class PersistentWebUI:
         """, unsafe_allow_html=True)
 
 
+# No spinner: it would emit an element before run() calls st.set_page_config
+@st.cache_resource(show_spinner=False)
+def get_app():
+    """Single WebUI instance (and connection pool) shared across reruns."""
+    return PersistentWebUI()
+
+
 if __name__ == "__main__":
-    app = PersistentWebUI()
+    app = get_app()
     app.run()
\ No newline at end of file